@@ -0,0 +1,117 @@
+"""Move old, finished orders out of the hot orders tables.
+
+    python archive.py --days 90
+
+Archived orders keep their ids and are still served by the order read
+routes, which fall through to the archive tables when an order isn't hot.
+The hot tables use AUTOINCREMENT, so those ids are never handed out again.
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, insert, literal, select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, engine, Base
+from init_db import add_missing_columns, migrate_autoincrement
+from db_models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem, ChangeLogEntry
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("FRED_STORE_ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_STATUSES = ("Completed", "Failed")
+BATCH_SIZE = 500
+
+ORDER_COLUMNS = ["id", "user_id", "created_at", "status", "total_amount"]
+ITEM_COLUMNS = ["id", "order_id", "product_id", "quantity", "price_at_purchase"]
+# Change log op for rows moved to the archive; they are still readable by id
+ARCHIVE_OP = "archive"
+
+
+def _log_archived(db: Session, model, id_column, ids: List[int]):
+    """Record archived rows in the change log, which Core deletes bypass"""
+    db.execute(insert(ChangeLogEntry).from_select(
+        ["table_name", "row_id", "op", "created_at"],
+        select(literal(model.__tablename__), model.id, literal(ARCHIVE_OP), literal(datetime.utcnow()))
+        .where(id_column.in_(ids))
+        .order_by(model.id),
+    ))
+
+
+def archive_orders(db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS,
+                   batch_size: int = BATCH_SIZE) -> int:
+    """Move finished orders older than older_than_days, with their items, into the archive.
+
+    Each batch is copied and deleted in its own transaction, so writers are
+    only ever blocked for one batch. Every moved order and item is recorded
+    in the change log with op "archive". Returns the number of orders moved.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    moved = 0
+    while True:
+        ids = [
+            row.id for row in db.query(Order.id)
+            .filter(
+                Order.created_at < cutoff,
+                Order.status.in_(ARCHIVE_STATUSES),
+            )
+            .order_by(Order.id)
+            .limit(batch_size)
+        ]
+        if not ids:
+            return moved
+
+        db.execute(insert(ArchivedOrder).from_select(
+            ORDER_COLUMNS,
+            select(*[getattr(Order, name) for name in ORDER_COLUMNS]).where(Order.id.in_(ids)),
+        ))
+        db.execute(insert(ArchivedOrderItem).from_select(
+            ITEM_COLUMNS,
+            select(*[getattr(OrderItem, name) for name in ITEM_COLUMNS]).where(OrderItem.order_id.in_(ids)),
+        ))
+        _log_archived(db, Order, Order.id, ids)
+        _log_archived(db, OrderItem, OrderItem.order_id, ids)
+        db.execute(delete(OrderItem).where(OrderItem.order_id.in_(ids)))
+        db.execute(delete(Order).where(Order.id.in_(ids)))
+        db.commit()
+        moved += len(ids)
+
+
+def find_archived_order(db: Session, order_id: int, options: Optional[list] = None) -> Optional[ArchivedOrder]:
+    return db.query(ArchivedOrder).options(*(options or [])).filter(ArchivedOrder.id == order_id).first()
+
+
+def archived_orders_for_user(db: Session, user_id: int, options: Optional[list] = None) -> List[ArchivedOrder]:
+    return db.query(ArchivedOrder).options(*(options or [])).filter(ArchivedOrder.user_id == user_id).all()
+
+
+def delete_archived_order(db: Session, order: ArchivedOrder):
+    """Delete an archived order and its items, logging them as deleted from the hot tables"""
+    now = datetime.utcnow()
+    for item in order.items:
+        db.add(ChangeLogEntry(table_name=OrderItem.__tablename__, row_id=item.id, op="delete", created_at=now))
+        db.delete(item)
+    db.add(ChangeLogEntry(table_name=Order.__tablename__, row_id=order.id, op="delete", created_at=now))
+    db.delete(order)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old, finished orders")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help=f"Archive orders older than this many days (default: {ARCHIVE_AFTER_DAYS})")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    migrate_autoincrement()
+    db = SessionLocal()
+    try:
+        moved = archive_orders(db, args.days, args.batch_size)
+        print(f"Archived {moved} orders")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+from collections import defaultdict
+from typing import List
+
+from sqlalchemy.orm import Session, selectinload
+
+import models
+from dataloader import DataLoader
+from db_models import User, Product, Order, Subscription, ArchivedOrder
+from metrics import metrics
+
+MAX_BATCH_SIZE = 50
+
+# resource -> (loader name, response schema, user-scoped list)
+RESOURCES = {
+    "user": ("users", models.User, False),
+    "product": ("products", models.Product, False),
+    "order": ("orders", models.Order, False),
+    "subscription": ("subscriptions", models.Subscription, False),
+    "user_orders": ("user_orders", models.Order, True),
+    "user_subscriptions": ("user_subscriptions", models.Subscription, True),
+}
+
+
+def _by_id(db: Session, model, *options) -> DataLoader:
+    def batch_load(ids):
+        rows = db.query(model).options(*options).filter(model.id.in_(ids)).all()
+        return {row.id: row for row in rows}
+    return DataLoader(batch_load)
+
+
+def _by_user(db: Session, model, *options) -> DataLoader:
+    def batch_load(user_ids):
+        grouped = defaultdict(list)
+        rows = db.query(model).options(*options).filter(model.user_id.in_(user_ids)).all()
+        for row in rows:
+            grouped[row.user_id].append(row)
+        return grouped
+    return DataLoader(batch_load, default=())
+
+
+def _product_ids(row) -> List[int]:
+    if isinstance(row, (Order, ArchivedOrder)):
+        return [item.product_id for item in row.items]
+    return [row.product_id]
+
+
+def _lookup(loaders, name: str, key: int):
+    """Hot rows for a request, followed by any archived orders"""
+    found = loaders[name].get(key)
+    if name == "orders" and found is None:
+        return loaders["archived_orders"].get(key)
+    if name == "user_orders":
+        return list(loaders["archived_user_orders"].get(key)) + list(found)
+    return found
+
+
+def resolve_batch(db: Session, requests: List[models.BatchRequestItem]) -> List[models.BatchResult]:
+    """Resolve several read requests with one query per resource type.
+
+    Products referenced by orders and subscriptions are fetched in the same
+    IN query as directly requested products; they then sit in the session
+    identity map, so rendering item.product issues no further SQL.
+    """
+    loaders = {
+        "users": _by_id(db, User),
+        "products": _by_id(db, Product),
+        "orders": _by_id(db, Order, selectinload(Order.items)),
+        "subscriptions": _by_id(db, Subscription),
+        "user_orders": _by_user(db, Order, selectinload(Order.items)),
+        "user_subscriptions": _by_user(db, Subscription),
+        "archived_orders": _by_id(db, ArchivedOrder, selectinload(ArchivedOrder.items)),
+        "archived_user_orders": _by_user(db, ArchivedOrder, selectinload(ArchivedOrder.items)),
+    }
+
+    for request in requests:
+        name, _, user_scoped = RESOURCES[request.resource]
+        loaders[name].load(request.id)
+        if user_scoped:
+            loaders["users"].load(request.id)
+        if name == "user_orders":
+            loaders["archived_user_orders"].load(request.id)
+    for name, loader in loaders.items():
+        if name not in ("products", "archived_orders"):
+            loader.dispatch()
+
+    # Orders that aren't hot may have been archived
+    for request in requests:
+        if request.resource == "order" and loaders["orders"].get(request.id) is None:
+            loaders["archived_orders"].load(request.id)
+    loaders["archived_orders"].dispatch()
+
+    # Second round: every product the orders and subscriptions point at
+    for request in requests:
+        name, _, user_scoped = RESOURCES[request.resource]
+        if name in ("users", "products"):
+            continue
+        found = _lookup(loaders, name, request.id)
+        rows = found if user_scoped else [found] if found is not None else []
+        for row in rows:
+            loaders["products"].load_many(_product_ids(row))
+    loaders["products"].dispatch()
+
+    results = []
+    for request in requests:
+        name, schema, user_scoped = RESOURCES[request.resource]
+        if user_scoped:
+            found = loaders["users"].get(request.id)
+            label = "User"
+        else:
+            found = _lookup(loaders, name, request.id)
+            label = request.resource.capitalize()
+
+        if found is None:
+            results.append(models.BatchResult(
+                resource=request.resource, id=request.id, status=404, detail=f"{label} not found"
+            ))
+        elif user_scoped:
+            rows = _lookup(loaders, name, request.id)
+            results.append(models.BatchResult(
+                resource=request.resource, id=request.id, status=200,
+                data=[schema.model_validate(row).model_dump(mode="json") for row in rows]
+            ))
+        else:
+            results.append(models.BatchResult(
+                resource=request.resource, id=request.id, status=200,
+                data=schema.model_validate(found).model_dump(mode="json")
+            ))
+
+    metrics.incr("batch.requests")
+    metrics.incr("batch.items", len(requests))
+    return results
@@ -0,0 +1,62 @@
+import asyncio
+import json
+import time
+from typing import List, Optional
+
+from fastapi import Request
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import models
+from database import SessionLocal
+from db_models import ChangeLogEntry
+
+MAX_CHANGES = 1000
+POLL_INTERVAL = 1.0
+KEEPALIVE_INTERVAL = 15.0
+
+
+def is_retained(db: Session, since: int) -> bool:
+    """Whether every change after since is still in the log, or some were pruned"""
+    oldest: Optional[int] = db.query(func.min(ChangeLogEntry.seq)).scalar()
+    return oldest is None or since >= oldest - 1
+
+
+def read_changes(db: Session, since: int, limit: int = MAX_CHANGES) -> List[ChangeLogEntry]:
+    return (
+        db.query(ChangeLogEntry)
+        .filter(ChangeLogEntry.seq > since)
+        .order_by(ChangeLogEntry.seq)
+        .limit(limit)
+        .all()
+    )
+
+
+def _read_serialized(since: int) -> list:
+    db = SessionLocal()
+    try:
+        return [models.ChangeEntry.model_validate(entry).model_dump(mode="json")
+                for entry in read_changes(db, since)]
+    finally:
+        db.close()
+
+
+async def change_events(request: Request, since: int):
+    """Server-Sent Events for every change after since, polling the change log"""
+    last_seq = since
+    last_sent = time.monotonic()
+    # Sent at once so the client gets the response headers without waiting
+    yield ": connected\n\n"
+    while not await request.is_disconnected():
+        entries = await run_in_threadpool(_read_serialized, last_seq)
+        for entry in entries:
+            yield f"id: {entry['seq']}\nevent: change\ndata: {json.dumps(entry)}\n\n"
+            last_seq = entry["seq"]
+        if entries:
+            last_sent = time.monotonic()
+            continue
+        if time.monotonic() - last_sent > KEEPALIVE_INTERVAL:
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(POLL_INTERVAL)
@@ -0,0 +1,199 @@
+import gzip
+import threading
+import time
+from typing import Callable, Optional
+
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Bodies smaller than this are sent as-is; the headers would eat the savings
+MINIMUM_SIZE = 1024
+# Bodies larger than this are compressed in a worker thread, not on the event loop
+THREADPOOL_SIZE = 64 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def supported_encodings() -> list:
+    """Encodings we can produce, in order of preference"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header"""
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in supported_encodings():
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a body and record the ratio and CPU time spent"""
+    started = time.thread_time()
+    if encoding == "br":
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    elapsed = time.thread_time() - started
+
+    metrics.incr(f"compression.{encoding}.responses")
+    metrics.incr(f"compression.{encoding}.bytes_in", len(body))
+    metrics.incr(f"compression.{encoding}.bytes_out", len(compressed))
+    metrics.incr(f"compression.{encoding}.cpu_seconds", elapsed)
+    return compressed
+
+
+def compression_summary() -> dict:
+    """Per-encoding compression ratio and CPU time derived from the counters"""
+    counters = metrics.snapshot()
+    summary = {}
+    for encoding in supported_encodings():
+        prefix = f"compression.{encoding}."
+        bytes_in = counters.get(prefix + "bytes_in", 0)
+        bytes_out = counters.get(prefix + "bytes_out", 0)
+        summary[encoding] = {
+            "responses": int(counters.get(prefix + "responses", 0)),
+            "bytes_in": int(bytes_in),
+            "bytes_out": int(bytes_out),
+            "ratio": round(bytes_in / bytes_out, 2) if bytes_out else None,
+            "cpu_seconds": round(counters.get(prefix + "cpu_seconds", 0), 6),
+        }
+    return summary
+
+
+class CompressionMiddleware:
+    """Compress buffered responses above a size threshold.
+
+    Streaming responses and bodies that already carry a Content-Encoding
+    (such as the precompressed catalog) are passed through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if ("content-encoding" in headers or content_type.startswith("text/event-stream")
+                        or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            if len(body) > THREADPOOL_SIZE:
+                compressed = await run_in_threadpool(compress, body, encoding)
+            else:
+                compressed = compress(body, encoding)
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
+
+
+class PrecompressedCache:
+    """Rendered response bodies kept alongside their compressed variants.
+
+    Each variant is compressed once, on first request for that encoding, so
+    hot and rarely changing bodies never pay for recompression.
+    """
+
+    def __init__(self, minimum_size: int = MINIMUM_SIZE):
+        self.minimum_size = minimum_size
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generation = 0
+
+    def response(self, key: str, encoding: Optional[str], build: Callable[[], bytes],
+                 media_type: str = "application/json") -> Response:
+        with self._lock:
+            variants = self._entries.get(key)
+            generation = self._generation
+
+        if variants is None:
+            metrics.incr("precompressed.misses")
+            variants = {None: build()}
+            with self._lock:
+                # Don't store a body rendered before a concurrent invalidation
+                if generation == self._generation:
+                    variants = self._entries.setdefault(key, variants)
+        else:
+            metrics.incr("precompressed.hits")
+
+        if encoding is None or len(variants[None]) < self.minimum_size:
+            encoding = None
+        elif encoding not in variants:
+            variants[encoding] = compress(variants[None], encoding)
+
+        headers = {"Vary": "Accept-Encoding"}
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return Response(content=variants[encoding], media_type=media_type, headers=headers)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generation += 1
+
+
+catalog_cache = PrecompressedCache()
@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from database import SessionLocal
+from db_models import CacheInvalidation
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+INIT_LOCK_PATH = os.getenv("FRED_STORE_INIT_LOCK", "./freds_store.db.init.lock")
+# Set by server.py once the database has been initialized before workers start
+PRELOADED_ENV = "FRED_STORE_PRELOADED"
+POLL_INTERVAL = 0.5
+RETENTION = timedelta(hours=1)
+
+
+class FileLock:
+    """An exclusive lock held across every thread and process that uses the same path.
+
+    Unlike threading.Lock it may be released from a different thread than
+    the one that acquired it, which lets a route hand it to a background task.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._handle = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._lock.acquire(blocking):
+            return False
+        handle = open(self.path, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            handle.close()
+            self._lock.release()
+            if blocking:
+                raise
+            return False
+        self._handle = handle
+        return True
+
+    def release(self):
+        handle, self._handle = self._handle, None
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            handle.close()
+            self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+@contextmanager
+def initializer_lock(path: str = INIT_LOCK_PATH):
+    """Hold an exclusive file lock so only one process initializes the database at a time"""
+    with FileLock(path):
+        yield
+
+
+class InvalidationBus:
+    """Cross-process cache invalidation through a log table in the shared SQLite file.
+
+    publish() records a key and notifies local subscribers immediately; other
+    worker processes pick it up on their next poll(), which reads the log at
+    most once per poll_interval.
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._last_seq = None
+        self._next_poll = 0.0
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def _notify(self, keys):
+        for key in keys:
+            for callback in self._subscribers:
+                callback(key)
+
+    def publish(self, key: str):
+        db = SessionLocal()
+        try:
+            db.add(CacheInvalidation(key=key))
+            db.query(CacheInvalidation).filter(
+                CacheInvalidation.created_at < datetime.utcnow() - RETENTION
+            ).delete()
+            db.commit()
+        finally:
+            db.close()
+        self._notify([key])
+
+    def poll(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_poll:
+                return
+            self._next_poll = now + self.poll_interval
+            last_seq = self._last_seq
+
+        db = SessionLocal()
+        try:
+            if last_seq is None:
+                # Nothing is cached yet, so earlier invalidations don't matter
+                rows = []
+                newest = db.query(func.max(CacheInvalidation.seq)).scalar() or 0
+            else:
+                rows = (
+                    db.query(CacheInvalidation)
+                    .filter(CacheInvalidation.seq > last_seq)
+                    .order_by(CacheInvalidation.seq)
+                    .all()
+                )
+                newest = rows[-1].seq if rows else last_seq
+        finally:
+            db.close()
+
+        with self._lock:
+            self._last_seq = max(newest, self._last_seq or 0)
+        self._notify({row.key for row in rows})
+
+
+invalidations = InvalidationBus()
@@ -0,0 +1,36 @@
+from typing import Callable, Dict, Hashable, Iterable, List
+
+
+class DataLoader:
+    """Collect keys during one request and resolve them with a single batched query.
+
+    Call load() for every key that will be needed, dispatch() once, then read
+    the results with get(). Keys resolved by an earlier dispatch are cached and
+    never fetched twice.
+    """
+
+    def __init__(self, batch_load: Callable[[List[Hashable]], Dict], default=None):
+        self._batch_load = batch_load
+        self._default = default
+        self._cache = {}
+        self._pending = set()
+
+    def load(self, key: Hashable):
+        if key not in self._cache:
+            self._pending.add(key)
+
+    def load_many(self, keys: Iterable[Hashable]):
+        for key in keys:
+            self.load(key)
+
+    def dispatch(self):
+        if not self._pending:
+            return
+        keys = sorted(self._pending)
+        self._pending.clear()
+        results = self._batch_load(keys)
+        for key in keys:
+            self._cache[key] = results.get(key, self._default)
+
+    def get(self, key: Hashable):
+        return self._cache.get(key, self._default)
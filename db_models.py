@@ -1,6 +1,10 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Date
+import os
+import threading
+import time
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Date, JSON, LargeBinary
+from sqlalchemy import delete, event, inspect, insert
 from sqlalchemy.orm import relationship
-from datetime import datetime
+from datetime import date, datetime, timedelta
 
 from database import Base
 
@@ -17,6 +21,8 @@ class User(Base):
     last_login = Column(DateTime, nullable=True)
 
     orders = relationship("Order", back_populates="user")
+    # Read-only, so deleting a user never rewrites the archive
+    archived_orders = relationship("ArchivedOrder", back_populates="user", viewonly=True)
     subscriptions = relationship("Subscription", back_populates="user")
 
 class Product(Base):
@@ -40,6 +46,8 @@ class Product(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    # Never reuse ids: archived orders keep theirs
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -52,6 +60,7 @@ class Order(Base):
 
 class OrderItem(Base):
     __tablename__ = "order_items"
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"))
@@ -73,4 +82,115 @@ class Subscription(Base):
     auto_renew = Column(Boolean, default=True)
 
     user = relationship("User", back_populates="subscriptions")
-    product = relationship("Product", back_populates="subscriptions") 
\ No newline at end of file
+    product = relationship("Product", back_populates="subscriptions") 
+
+class ArchivedOrder(Base):
+    __tablename__ = "archived_orders"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    created_at = Column(DateTime)
+    status = Column(String)
+    total_amount = Column(Float)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    user = relationship("User", back_populates="archived_orders", viewonly=True)
+    items = relationship("ArchivedOrderItem", back_populates="order")
+
+class ArchivedOrderItem(Base):
+    __tablename__ = "archived_order_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("archived_orders.id"), index=True)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    quantity = Column(Integer, default=1)
+    price_at_purchase = Column(Float)
+
+    order = relationship("ArchivedOrder", back_populates="items")
+    product = relationship("Product")
+
+class CacheInvalidation(Base):
+    __tablename__ = "cache_invalidations"
+
+    seq = Column(Integer, primary_key=True)
+    key = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class ChangeLogEntry(Base):
+    __tablename__ = "change_log"
+    # Sequence numbers are cursors for /changes clients, so never reuse one
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)
+    data = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)
+    # Null until the first request with this key has finished
+    status_code = Column(Integer, nullable=True)
+    content_type = Column(String, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, index=True)
+    # When the request now running under this key claimed it; a claim older
+    # than the lease is from a crashed worker and may be taken over
+    claimed_at = Column(DateTime, nullable=True)
+
+# Change log: every insert, update and delete of a tracked model made through
+# a Session flush is recorded, whichever module makes it. Core statements and
+# bulk Query.update()/delete() skip mapper events and aren't captured; code
+# using them must write its own entries, as archive_orders does. Entries older
+# than the retention period are pruned, at most once per
+# CHANGE_LOG_PRUNE_INTERVAL per process.
+TRACKED_MODELS = (User, Product, Order, OrderItem, Subscription)
+CHANGE_LOG_RETENTION = timedelta(days=int(os.getenv("FRED_STORE_CHANGE_LOG_RETENTION_DAYS", "7")))
+CHANGE_LOG_PRUNE_INTERVAL = 60.0
+
+_prune_lock = threading.Lock()
+_next_prune = 0.0
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def _row_data(target) -> dict:
+    mapper = inspect(target).mapper
+    return {attr.key: _json_value(getattr(target, attr.key)) for attr in mapper.column_attrs}
+
+def _prune_change_log(connection, now: datetime):
+    global _next_prune
+    with _prune_lock:
+        if time.monotonic() < _next_prune:
+            return
+        _next_prune = time.monotonic() + CHANGE_LOG_PRUNE_INTERVAL
+    connection.execute(delete(ChangeLogEntry).where(ChangeLogEntry.created_at < now - CHANGE_LOG_RETENTION))
+
+def _change_recorder(op: str):
+    def record(mapper, connection, target):
+        state = inspect(target)
+        if op == "update" and not any(attr.history.has_changes() for attr in state.attrs):
+            return
+        # Written on the flush's own connection, so the entry commits or
+        # rolls back together with the change it describes
+        now = datetime.utcnow()
+        connection.execute(insert(ChangeLogEntry).values(
+            table_name=mapper.local_table.name,
+            row_id=target.id,
+            op=op,
+            data=None if op == "delete" else _row_data(target),
+            created_at=now,
+        ))
+        _prune_change_log(connection, now)
+    return record
+
+for _model in TRACKED_MODELS:
+    for _op in ("insert", "update", "delete"):
+        event.listen(_model, f"after_{_op}", _change_recorder(_op))
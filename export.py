@@ -0,0 +1,208 @@
+"""Export store tables to compressed columnar files for offline analytics.
+
+    python export.py                  # new rows since the last run, as Parquet
+    python export.py --full           # every row, ignoring earlier runs
+    python export.py --format arrow   # Arrow IPC files instead of Parquet
+
+Tables are read straight from the database in id order, a batch at a time, so
+memory stays bounded and the API request path is never involved. Each run
+records the highest id exported per table; the next run only reads rows above
+that high-water mark. A full run replaces each table's earlier files with one
+new file, so every row is exported once.
+
+Archived orders keep the ids they had while hot, so archive tables only export
+rows above the hot table's mark from before the run; anything at or below it
+was already exported as a hot row. An order archived while a run is reading
+its hot table can still appear in both files, so consumers should dedupe
+orders and order items by id.
+
+Only one export runs at a time across every process, guarded by a file lock.
+"""
+import argparse
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, String, select
+
+from coordination import FileLock
+from database import engine
+from db_models import User, Product, Order, OrderItem, Subscription, ArchivedOrder, ArchivedOrderItem
+
+EXPORT_DIR = os.getenv("FRED_STORE_EXPORT_DIR", "./exports")
+EXPORT_TABLES = [User, Product, Subscription, Order, OrderItem, ArchivedOrder, ArchivedOrderItem]
+BATCH_SIZE = 5000
+STATE_FILE = "_state.json"
+FORMATS = ("parquet", "arrow")
+# Archive tables and the hot tables their rows came from
+ARCHIVE_SOURCES = {ArchivedOrder: Order, ArchivedOrderItem: OrderItem}
+
+EXPORT_LOCK_PATH = os.getenv("FRED_STORE_EXPORT_LOCK", "./freds_store.db.export.lock")
+export_lock = FileLock(EXPORT_LOCK_PATH)
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise RuntimeError("Exports need pyarrow: pip install pyarrow")
+
+
+def _arrow_schema(table):
+    pa = _require_pyarrow()
+    types = [
+        (Boolean, pa.bool_()),
+        (Integer, pa.int64()),
+        (Float, pa.float64()),
+        (DateTime, pa.timestamp("us")),
+        (Date, pa.date32()),
+        (String, pa.string()),
+    ]
+    fields = []
+    for column in table.columns:
+        arrow_type = next((t for sql_type, t in types if isinstance(column.type, sql_type)), pa.string())
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def load_state(out_dir: str = EXPORT_DIR) -> dict:
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {"tables": {}}
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def _save_state(out_dir: str, state: dict):
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(path + ".tmp", "w") as handle:
+        json.dump(state, handle, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def export_table(model, out_dir: str, since_id: int = 0, fmt: str = "parquet",
+                 batch_size: int = BATCH_SIZE) -> Optional[dict]:
+    """Write rows of model with id above since_id to one compressed file.
+
+    Returns the file path, row count and new high-water mark, or None when
+    there was nothing new to export.
+    """
+    pa = _require_pyarrow()
+    table = model.__table__
+    schema = _arrow_schema(table)
+    directory = os.path.join(out_dir, table.name)
+    partial = os.path.join(directory, f"{table.name}-{since_id + 1}.partial")
+
+    writer = None
+    rows_written = 0
+    last_id = since_id
+    try:
+        while True:
+            # Keyset pagination: each batch is a short read on the primary key index
+            with engine.connect() as connection:
+                rows = connection.execute(
+                    select(table).where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+                ).mappings().all()
+            if not rows:
+                break
+
+            batch = pa.RecordBatch.from_pylist([dict(row) for row in rows], schema=schema)
+            if writer is None:
+                os.makedirs(directory, exist_ok=True)
+                if fmt == "parquet":
+                    import pyarrow.parquet as pq
+                    writer = pq.ParquetWriter(partial, schema, compression="zstd")
+                else:
+                    options = pa.ipc.IpcWriteOptions(compression="zstd")
+                    writer = pa.ipc.new_file(partial, schema, options=options)
+            writer.write_batch(batch)
+            rows_written += len(rows)
+            last_id = rows[-1]["id"]
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        return None
+    # Files are named after the id range they hold
+    path = os.path.join(directory, f"{table.name}-{since_id + 1}-{last_id}.{fmt}")
+    os.replace(partial, path)
+    return {"path": path, "rows": rows_written, "high_water_mark": last_id}
+
+
+def _table_files(out_dir: str, name: str) -> list:
+    directory = os.path.join(out_dir, name)
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, filename) for filename in os.listdir(directory)
+            if filename.startswith(f"{name}-")]
+
+
+def export_snapshot(out_dir: str = EXPORT_DIR, fmt: str = "parquet", full: bool = False,
+                    batch_size: int = BATCH_SIZE) -> dict:
+    """Export every table, incrementally unless full is set, and record the new high-water marks.
+
+    State is saved after each table, so a run that stops part way leaves
+    every table with files and a mark that agree.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'")
+
+    os.makedirs(out_dir, exist_ok=True)
+    state = load_state(out_dir)
+    previous_marks = {} if full else dict(state["tables"])
+    files = []
+    for model in EXPORT_TABLES:
+        name = model.__tablename__
+        since_id = 0 if full else state["tables"].get(name, 0)
+        if model in ARCHIVE_SOURCES:
+            since_id = max(since_id, previous_marks.get(ARCHIVE_SOURCES[model].__tablename__, 0))
+        # Earlier files are only removed once the full file replacing them is written
+        stale = _table_files(out_dir, name) if full else []
+        result = export_table(model, out_dir, since_id, fmt, batch_size)
+        for path in stale:
+            if result is None or path != result["path"]:
+                os.remove(path)
+        if result:
+            files.append(result)
+            state["tables"][name] = result["high_water_mark"]
+        elif full:
+            state["tables"].pop(name, None)
+        _save_state(out_dir, state)
+    state["last_run"] = datetime.utcnow().isoformat()
+    _save_state(out_dir, state)
+    return {"files": files, "tables": state["tables"], "last_run": state["last_run"]}
+
+
+def run_export(fmt: str = "parquet", full: bool = False):
+    """Run an export for a caller that already holds export_lock, releasing it afterwards"""
+    try:
+        export_snapshot(fmt=fmt, full=full)
+    finally:
+        export_lock.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export store tables to Parquet or Arrow files")
+    parser.add_argument("--out", default=EXPORT_DIR, help=f"Output directory (default: {EXPORT_DIR})")
+    parser.add_argument("--format", choices=FORMATS, default="parquet")
+    parser.add_argument("--full", action="store_true", help="Export every row, ignoring high-water marks")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    if not export_lock.acquire(blocking=False):
+        raise SystemExit("An export is already running")
+    try:
+        result = export_snapshot(args.out, args.format, args.full, args.batch_size)
+    finally:
+        export_lock.release()
+    for exported in result["files"]:
+        print(f"{exported['path']}: {exported['rows']} rows")
+    if not result["files"]:
+        print("Nothing new to export")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only, selectinload
+from sqlalchemy.orm.interfaces import MANYTOONE
+
+import models
+from db_models import User, Product, Order, OrderItem, Subscription
+
+# Columns selected by fields=summary, and for every expanded relationship
+SUMMARIES = {
+    Product: models.ProductRef,
+    User: models.UserRef,
+    Order: models.OrderSummary,
+    OrderItem: models.OrderItemSummary,
+    Subscription: models.SubscriptionSummary,
+}
+
+# Relationships each resource allows in expand=
+EXPANSIONS = {
+    Product: (),
+    User: ("orders", "subscriptions"),
+    Order: ("items", "user"),
+    OrderItem: ("product",),
+    Subscription: ("product", "user"),
+}
+
+# Expanded relationships whose rows may have moved to an archive table, and
+# the relationship that loads the archived ones
+ARCHIVED = {
+    (User, "orders"): "archived_orders",
+}
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+def column_names(model) -> List[str]:
+    return [attr.key for attr in inspect(model).column_attrs]
+
+
+def summary_columns(model) -> List[str]:
+    fields = SUMMARIES[model].model_fields
+    return [name for name in column_names(model) if name in fields]
+
+
+class Fieldset:
+    """Columns and expanded relationships requested for one resource"""
+
+    def __init__(self, model, columns: List[str]):
+        self.model = model
+        self.columns = columns
+        self.children = {}
+
+    def options(self, model=None) -> list:
+        """Loader options that fetch only the requested columns and relationships.
+
+        model may name a class with the same columns and relationships, such as
+        ArchivedOrder for an Order fieldset.
+        """
+        model = model or self.model
+        mapper = inspect(model)
+        columns = list(self.columns)
+        for name in self.children:
+            relationship = mapper.relationships[name]
+            if relationship.direction is MANYTOONE:
+                # The foreign key is needed to load the related row
+                columns += [c.key for c in relationship.local_columns if c.key not in columns]
+
+        options = [load_only(*[getattr(model, name) for name in columns])]
+        for name, child in self.children.items():
+            names = [name]
+            if (self.model, name) in ARCHIVED:
+                names.append(ARCHIVED[self.model, name])
+            for relationship_name in names:
+                related = mapper.relationships[relationship_name].mapper.class_
+                options.append(selectinload(getattr(model, relationship_name)).options(*child.options(related)))
+        return options
+
+    def render(self, obj) -> dict:
+        """Serialize only the requested attributes of a loaded object"""
+        data = {name: getattr(obj, name) for name in self.columns}
+        for name, child in self.children.items():
+            related = getattr(obj, name)
+            if (self.model, name) in ARCHIVED:
+                # Archived rows first, as the order routes list them
+                related = list(getattr(obj, ARCHIVED[self.model, name])) + list(related)
+            if related is None:
+                data[name] = None
+            elif isinstance(related, list):
+                data[name] = [child.render(item) for item in related]
+            else:
+                data[name] = child.render(related)
+        return data
+
+
+def _parse_columns(model, fields: Optional[str]) -> List[str]:
+    if not fields:
+        return column_names(model)
+    if fields == "summary":
+        return summary_columns(model)
+
+    available = column_names(model)
+    columns = ["id"]
+    for name in _split(fields):
+        if name not in available:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown field '{name}' for {model.__tablename__}"
+            )
+        if name not in columns:
+            columns.append(name)
+    return columns
+
+
+def parse_fieldset(model, fields: Optional[str], expand: Optional[str]) -> Optional[Fieldset]:
+    """Build a Fieldset from the fields= and expand= query values.
+
+    fields is a comma-separated list of columns (id is always included) or
+    "summary"; expand is a comma-separated list of relationship paths such as
+    "items.product", each rendered with its summary columns. Returns None when
+    neither is given, or both are blank, so routes keep their full response.
+    """
+    if not _split(fields) and not _split(expand):
+        return None
+
+    fieldset = Fieldset(model, _parse_columns(model, fields))
+    for path in _split(expand):
+        node = fieldset
+        for name in path.split("."):
+            if name not in EXPANSIONS[node.model]:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Cannot expand '{path}' on {model.__tablename__}"
+                )
+            if name not in node.children:
+                related = inspect(node.model).relationships[name].mapper.class_
+                node.children[name] = Fieldset(related, summary_columns(related))
+            node = node.children[name]
+    return fieldset
@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Optional, Tuple
+
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+from database import SessionLocal
+from db_models import IdempotencyKey
+from metrics import metrics
+
+KEY_HEADER = "idempotency-key"
+KEY_TTL = timedelta(hours=int(os.getenv("FRED_STORE_IDEMPOTENCY_TTL_HOURS", "24")))
+# An unfinished claim older than this is from a worker that died mid-request,
+# and the next request with the key takes it over. Keep it above the slowest POST.
+LEASE_TIMEOUT = timedelta(seconds=int(os.getenv("FRED_STORE_IDEMPOTENCY_LEASE_SECONDS", "30")))
+MAX_KEY_LENGTH = 255
+# How long a duplicate waits for the first request with its key to finish
+WAIT_TIMEOUT = 10.0
+WAIT_INTERVAL = 0.05
+PURGE_INTERVAL = 60.0
+
+CLAIMED = "claimed"
+IN_PROGRESS = "in_progress"
+REPLAY = "replay"
+MISMATCH = "mismatch"
+
+
+class IdempotencyStore:
+    """Idempotency keys and the responses they produced.
+
+    Kept in the shared database so every worker process sees the same keys;
+    expired keys are purged at most once per PURGE_INTERVAL.
+    """
+
+    def __init__(self, ttl: timedelta = KEY_TTL, lease: timedelta = LEASE_TIMEOUT):
+        self.ttl = ttl
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+
+    def _purge(self, db, now: datetime):
+        with self._lock:
+            if time.monotonic() < self._next_purge:
+                return
+            self._next_purge = time.monotonic() + PURGE_INTERVAL
+        db.query(IdempotencyKey).filter(IdempotencyKey.expires_at < now).delete()
+        db.commit()
+
+    def _takeover(self, db, record: IdempotencyKey, fingerprint: str, now: datetime) -> bool:
+        """Claim an expired key or a stale claim, unless another request takes it first"""
+        taken = db.query(IdempotencyKey).filter(
+            IdempotencyKey.key == record.key,
+            IdempotencyKey.claimed_at == record.claimed_at,
+            IdempotencyKey.expires_at == record.expires_at,
+        ).update({
+            "fingerprint": fingerprint,
+            "status_code": None,
+            "content_type": None,
+            "body": None,
+            "created_at": now,
+            "expires_at": now + self.ttl,
+            "claimed_at": now,
+        }, synchronize_session=False)
+        db.commit()
+        return taken == 1
+
+    def claim(self, key: str, fingerprint: str) -> Tuple[str, Any]:
+        """Claim key for a new request, or report what an earlier request with it left behind.
+
+        Returns CLAIMED with the claim token to pass to complete() or release(),
+        REPLAY with the stored response, or IN_PROGRESS or MISMATCH. The key is
+        read first and only written when it is missing, expired or its claim
+        is stale, so callers waiting on a running request only ever read.
+        """
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            record = db.get(IdempotencyKey, key)
+            if record is None:
+                self._purge(db, now)
+                db.add(IdempotencyKey(key=key, fingerprint=fingerprint, expires_at=now + self.ttl, claimed_at=now))
+                try:
+                    db.commit()
+                    return CLAIMED, now
+                except IntegrityError:
+                    # Another request claimed it first
+                    db.rollback()
+                    return IN_PROGRESS, None
+
+            if record.expires_at is not None and record.expires_at < now:
+                return (CLAIMED, now) if self._takeover(db, record, fingerprint, now) else (IN_PROGRESS, None)
+            if record.fingerprint != fingerprint:
+                return MISMATCH, None
+            if record.status_code is None:
+                if record.claimed_at is None or record.claimed_at < now - self.lease:
+                    metrics.incr("idempotency.takeovers")
+                    return (CLAIMED, now) if self._takeover(db, record, fingerprint, now) else (IN_PROGRESS, None)
+                return IN_PROGRESS, None
+            return REPLAY, {
+                "status_code": record.status_code,
+                "content_type": record.content_type,
+                "body": record.body,
+            }
+        finally:
+            db.close()
+
+    def complete(self, key: str, token: datetime, status_code: int, content_type: Optional[str], body: bytes):
+        """Store the response for key, unless its claim has since been taken over"""
+        db = SessionLocal()
+        try:
+            db.query(IdempotencyKey).filter(
+                IdempotencyKey.key == key, IdempotencyKey.claimed_at == token
+            ).update({
+                "status_code": status_code,
+                "content_type": content_type,
+                "body": body,
+            })
+            db.commit()
+        finally:
+            db.close()
+
+    def release(self, key: str, token: datetime):
+        """Forget a key whose request failed, so a retry runs it again"""
+        db = SessionLocal()
+        try:
+            db.query(IdempotencyKey).filter(
+                IdempotencyKey.key == key, IdempotencyKey.claimed_at == token
+            ).delete()
+            db.commit()
+        finally:
+            db.close()
+
+
+def _fingerprint(scope, body: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in (scope["method"], scope["path"], scope.get("query_string", b"").decode()):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class IdempotencyMiddleware:
+    """Honour the Idempotency-Key header on POST requests.
+
+    The first request with a key runs and its response is stored. Retries
+    with the same key and body get the stored response without touching the
+    database tables behind the route, and duplicates that arrive while the
+    first is still running wait for it instead of running a second
+    transaction. Responses with a 5xx status are not stored, and a request
+    that fails or is cancelled gives its key up. A claim whose worker died
+    is taken over once it is older than LEASE_TIMEOUT.
+    """
+
+    def __init__(self, app, store: Optional[IdempotencyStore] = None):
+        self.app = app
+        self.store = store or IdempotencyStore()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        key = Headers(scope=scope).get(KEY_HEADER)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            response = JSONResponse(
+                {"detail": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"}, status_code=400
+            )
+            await response(scope, receive, send)
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        fingerprint = _fingerprint(scope, body)
+
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        # Read-only while another request holds the key
+        state, stored = await run_in_threadpool(self.store.claim, key, fingerprint)
+        if state == IN_PROGRESS:
+            metrics.incr("idempotency.coalesced")
+        while state == IN_PROGRESS:
+            if time.monotonic() > deadline:
+                response = JSONResponse(
+                    {"detail": "A request with this Idempotency-Key is still in progress"}, status_code=409
+                )
+                await response(scope, receive, send)
+                return
+            await asyncio.sleep(WAIT_INTERVAL)
+            state, stored = await run_in_threadpool(self.store.claim, key, fingerprint)
+
+        if state == MISMATCH:
+            metrics.incr("idempotency.mismatches")
+            response = JSONResponse(
+                {"detail": "Idempotency-Key was already used for a different request"}, status_code=422
+            )
+            await response(scope, receive, send)
+            return
+
+        if state == REPLAY:
+            metrics.incr("idempotency.replays")
+            response = Response(
+                content=stored["body"],
+                status_code=stored["status_code"],
+                media_type=stored["content_type"],
+                headers={"Idempotent-Replayed": "true"},
+            )
+            await response(scope, receive, send)
+            return
+
+        await self._run_and_store(scope, receive, send, key, stored, body)
+
+    async def _run_and_store(self, scope, receive, send, key: str, token: datetime, body: bytes):
+        body_sent = False
+        status_code = None
+        content_type = None
+        chunks = []
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture_send(message):
+            nonlocal status_code, content_type
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                content_type = Headers(raw=message["headers"]).get("content-type")
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except Exception:
+            await run_in_threadpool(self.store.release, key, token)
+            raise
+        except BaseException:
+            # Cancelled, e.g. on shutdown; a further await could be cancelled
+            # too, so give the key up synchronously
+            self.store.release(key, token)
+            raise
+
+        if status_code is None or status_code >= 500:
+            await run_in_threadpool(self.store.release, key, token)
+        else:
+            await run_in_threadpool(self.store.complete, key, token, status_code, content_type, b"".join(chunks))
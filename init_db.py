@@ -1,12 +1,78 @@
 from datetime import datetime, date, timedelta
 import random
+from sqlalchemy import func, inspect, select, text
 from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
 from database import SessionLocal, engine, Base
-from db_models import User, Product, Order, OrderItem, Subscription
+from db_models import User, Product, Order, OrderItem, Subscription, ArchivedOrder, ArchivedOrderItem, ChangeLogEntry
+
+# Tables whose ids must never be reused, with any archive table holding their old ids
+AUTOINCREMENT_TABLES = [
+    (Order.__table__, ArchivedOrder.__table__),
+    (OrderItem.__table__, ArchivedOrderItem.__table__),
+    (ChangeLogEntry.__table__, None),
+]
+
+def add_missing_columns(bind=engine):
+    """Add nullable columns that models gained after their tables were created.
+
+    create_all only creates missing tables, never missing columns.
+    """
+    existing = inspect(bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not existing.has_table(table.name):
+                continue
+            present = {column["name"] for column in existing.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in present:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+def migrate_autoincrement(bind=engine):
+    """Rebuild tables created before they used AUTOINCREMENT.
+
+    Without it SQLite hands out max(id) + 1, reusing the ids of deleted and
+    archived rows. The sequence is seeded above every archived id as well.
+    """
+    with bind.begin() as connection:
+        for table, archive in AUTOINCREMENT_TABLES:
+            ddl = connection.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": table.name}
+            ).scalar()
+            if ddl is None or "AUTOINCREMENT" in ddl.upper():
+                continue
+
+            rebuilt = f"{table.name}_rebuild"
+            create = str(CreateTable(table).compile(connection))
+            connection.execute(text(create.replace(f"CREATE TABLE {table.name} (", f"CREATE TABLE {rebuilt} (", 1)))
+            columns = ", ".join(column.name for column in table.columns)
+            connection.execute(text(f"INSERT INTO {rebuilt} ({columns}) SELECT {columns} FROM {table.name}"))
+            connection.execute(text(f"DROP TABLE {table.name}"))
+            connection.execute(text(f"ALTER TABLE {rebuilt} RENAME TO {table.name}"))
+            for index in table.indexes:
+                index.create(connection)
+
+            highest = max(
+                connection.execute(select(func.max(source.primary_key.columns[0]))).scalar() or 0
+                for source in (table, archive) if source is not None
+            )
+            seeded = connection.execute(
+                text("UPDATE sqlite_sequence SET seq = MAX(seq, :seq) WHERE name = :name"),
+                {"seq": highest, "name": table.name}
+            ).rowcount
+            if not seeded:
+                connection.execute(
+                    text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                    {"seq": highest, "name": table.name}
+                )
 
 def init_db():
     # Create tables
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    migrate_autoincrement()
     
     db = SessionLocal()
     try:
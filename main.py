@@ -1,19 +1,32 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Query, Request
 from fastapi.responses import JSONResponse, Response
 from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from datetime import datetime, date
+import importlib.util
 import json
+import os
 from fastapi_mcp import FastApiMCP
 from fastapi.responses import StreamingResponse
 
-from database import engine, get_db
+from database import SessionLocal, engine, get_db
 import models
 import db_models
-from db_models import User, Product, Order, OrderItem, Subscription
+from db_models import User, Product, Order, OrderItem, Subscription, ArchivedOrder
 from init_db import init_db
+from compression import CompressionMiddleware, catalog_cache, compression_summary, negotiate_encoding
+from metrics import metrics
+from fieldsets import parse_fieldset
+from batch import MAX_BATCH_SIZE, resolve_batch
+import mcp_tools
+from coordination import PRELOADED_ENV, initializer_lock, invalidations
+from archive import (ARCHIVE_AFTER_DAYS, archive_orders, archived_orders_for_user, delete_archived_order,
+                     find_archived_order)
+from export import FORMATS, export_lock, load_state, run_export
+from changes import MAX_CHANGES, change_events, is_retained, read_changes
+from idempotency import IdempotencyMiddleware
 
 class PrettyJSONResponse(JSONResponse):
     def render(self, content) -> bytes:
@@ -25,11 +38,25 @@ class PrettyJSONResponse(JSONResponse):
             separators=(", ", ": "),
         ).encode("utf-8")
 
+def sparse_response(fieldset, content):
+    """Render a row or list of rows through a sparse fieldset"""
+    if isinstance(content, list):
+        return PrettyJSONResponse(content=[fieldset.render(row) for row in content])
+    return PrettyJSONResponse(content=fieldset.render(content))
+
+# Sparse fieldset parameters shared by the list and detail routes
+FIELDS_QUERY = Query(None, description="Comma-separated columns to return, or 'summary'")
+EXPAND_QUERY = Query(None, description="Comma-separated relationships to embed, e.g. 'items.product'")
+
 app = FastAPI(
     title="Fred's Store API",
     default_response_class=PrettyJSONResponse
 )
 
+# Replay POST responses for retried Idempotency-Key requests. Added first so it
+# sits inside CORS and compression and stores the plain response body.
+app.add_middleware(IdempotencyMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -39,39 +66,57 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize MCP with custom name and proper configuration
-mcp = FastApiMCP(
-    app,
-    name="Fred's Store MCP Server",
-    describe_all_responses=True,
-    describe_full_response_schema=True
-)
+# Compress large JSON bodies according to Accept-Encoding
+app.add_middleware(CompressionMiddleware)
 
-# Mount the MCP server
-mcp.mount()
+# Product writes in any worker process drop every worker's cached catalog
+invalidations.subscribe(catalog_cache.invalidate)
 
 @app.on_event("startup")
 async def startup_event():
-    # Create tables and initialize sample data
-    init_db()
+    # Create tables and initialize sample data, unless server.py already did
+    # so before starting workers. The lock keeps concurrent workers from racing.
+    if os.environ.get(PRELOADED_ENV) != "1":
+        with initializer_lock():
+            init_db()
 
 @app.get("/")
 def read_root():
     return {"message": "WELCOME TO FRED'S STORE"}
 
+@app.get("/metrics", tags=["metrics"])
+def get_metrics():
+    """Report process counters, including response compression ratio and CPU time"""
+    return {"counters": metrics.snapshot(), "compression": compression_summary()}
+
 # Product routes with proper documentation
 @app.get("/products", response_model=List[models.Product], tags=["products"])
-def get_products(db: Session = Depends(get_db)):
+def get_products(request: Request, fields: Optional[str] = FIELDS_QUERY, db: Session = Depends(get_db)):
     """List all available products in the store"""
-    return db.query(Product).all()
+    fieldset = parse_fieldset(Product, fields, None)
+    if fieldset:
+        return sparse_response(fieldset, db.query(Product).options(*fieldset.options()).all())
+
+    # The full listing is served from a precompressed cache until a product changes
+    def render():
+        products = [models.Product.model_validate(p) for p in db.query(Product).all()]
+        return PrettyJSONResponse(content=products).body
+
+    invalidations.poll()
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    return catalog_cache.response("products", encoding, render)
 
 @app.get("/products/{product_id}", response_model=models.Product, tags=["products"])
-def get_product(product_id: int, db: Session = Depends(get_db)):
+def get_product(product_id: int, fields: Optional[str] = FIELDS_QUERY, db: Session = Depends(get_db)):
     """Get details of a specific product by its ID"""
-    product = db.query(Product).filter(Product.id == product_id).first()
+    fieldset = parse_fieldset(Product, fields, None)
+    query = db.query(Product)
+    if fieldset:
+        query = query.options(*fieldset.options())
+    product = query.filter(Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    return sparse_response(fieldset, product) if fieldset else product
 
 @app.post("/products", response_model=models.Product, tags=["products"])
 def create_product(product: models.ProductCreate, db: Session = Depends(get_db)):
@@ -81,6 +126,7 @@ def create_product(product: models.ProductCreate, db: Session = Depends(get_db))
     db.add(db_product)
     db.commit()
     db.refresh(db_product)
+    invalidations.publish("products")
     return db_product
 
 @app.put("/products/{product_id}", response_model=models.Product)
@@ -94,6 +140,7 @@ def update_product(product_id: int, product: models.ProductCreate, db: Session =
     
     db.commit()
     db.refresh(db_product)
+    invalidations.publish("products")
     return db_product
 
 @app.delete("/products/{product_id}")
@@ -104,19 +151,29 @@ def delete_product(product_id: int, db: Session = Depends(get_db)):
     
     db.delete(product)
     db.commit()
+    invalidations.publish("products")
     return {"message": "Product deleted successfully"}
 
 # User routes
 @app.get("/users", response_model=List[models.User])
-def get_users(db: Session = Depends(get_db)):
+def get_users(fields: Optional[str] = FIELDS_QUERY, expand: Optional[str] = EXPAND_QUERY,
+              db: Session = Depends(get_db)):
+    fieldset = parse_fieldset(User, fields, expand)
+    if fieldset:
+        return sparse_response(fieldset, db.query(User).options(*fieldset.options()).all())
     return db.query(User).all()
 
 @app.get("/users/{user_id}", response_model=models.User)
-def get_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+def get_user(user_id: int, fields: Optional[str] = FIELDS_QUERY, expand: Optional[str] = EXPAND_QUERY,
+             db: Session = Depends(get_db)):
+    fieldset = parse_fieldset(User, fields, expand)
+    query = db.query(User)
+    if fieldset:
+        query = query.options(*fieldset.options())
+    user = query.filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return sparse_response(fieldset, user) if fieldset else user
 
 @app.post("/users", response_model=models.User)
 def create_user(user: models.UserCreate, db: Session = Depends(get_db)):
@@ -151,15 +208,27 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
 
 # Order routes
 @app.get("/orders", response_model=List[models.Order])
-def get_orders(db: Session = Depends(get_db)):
+def get_orders(fields: Optional[str] = FIELDS_QUERY, expand: Optional[str] = EXPAND_QUERY,
+               db: Session = Depends(get_db)):
+    fieldset = parse_fieldset(Order, fields, expand)
+    if fieldset:
+        return sparse_response(fieldset, db.query(Order).options(*fieldset.options()).all())
     return db.query(Order).all()
 
 @app.get("/orders/{order_id}", response_model=models.Order)
-def get_order(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(Order).filter(Order.id == order_id).first()
+def get_order(order_id: int, fields: Optional[str] = FIELDS_QUERY, expand: Optional[str] = EXPAND_QUERY,
+              db: Session = Depends(get_db)):
+    fieldset = parse_fieldset(Order, fields, expand)
+    query = db.query(Order)
+    if fieldset:
+        query = query.options(*fieldset.options())
+    order = query.filter(Order.id == order_id).first()
+    if not order:
+        # Older orders may have moved to the archive
+        order = find_archived_order(db, order_id, fieldset.options(ArchivedOrder) if fieldset else None)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    return order
+    return sparse_response(fieldset, order) if fieldset else order
 
 @app.post("/orders", response_model=models.Order)
 def create_order(order: models.OrderCreate, db: Session = Depends(get_db)):
@@ -187,24 +256,37 @@ def create_order(order: models.OrderCreate, db: Session = Depends(get_db)):
 @app.delete("/orders/{order_id}")
 def delete_order(order_id: int, db: Session = Depends(get_db)):
     order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    db.delete(order)
+    if order:
+        db.delete(order)
+    else:
+        # Older orders may have moved to the archive
+        archived = find_archived_order(db, order_id)
+        if not archived:
+            raise HTTPException(status_code=404, detail="Order not found")
+        delete_archived_order(db, archived)
     db.commit()
     return {"message": "Order deleted successfully"}
 
 # Subscription routes
 @app.get("/subscriptions", response_model=List[models.Subscription])
-def get_subscriptions(db: Session = Depends(get_db)):
+def get_subscriptions(fields: Optional[str] = FIELDS_QUERY, expand: Optional[str] = EXPAND_QUERY,
+                      db: Session = Depends(get_db)):
+    fieldset = parse_fieldset(Subscription, fields, expand)
+    if fieldset:
+        return sparse_response(fieldset, db.query(Subscription).options(*fieldset.options()).all())
     return db.query(Subscription).all()
 
 @app.get("/subscriptions/{subscription_id}", response_model=models.Subscription)
-def get_subscription(subscription_id: int, db: Session = Depends(get_db)):
-    subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+def get_subscription(subscription_id: int, fields: Optional[str] = FIELDS_QUERY, expand: Optional[str] = EXPAND_QUERY,
+                     db: Session = Depends(get_db)):
+    fieldset = parse_fieldset(Subscription, fields, expand)
+    query = db.query(Subscription)
+    if fieldset:
+        query = query.options(*fieldset.options())
+    subscription = query.filter(Subscription.id == subscription_id).first()
     if not subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
-    return subscription
+    return sparse_response(fieldset, subscription) if fieldset else subscription
 
 @app.post("/subscriptions", response_model=models.Subscription)
 def create_subscription(subscription: models.SubscriptionCreate, db: Session = Depends(get_db)):
@@ -239,15 +321,102 @@ def delete_subscription(subscription_id: int, db: Session = Depends(get_db)):
 
 # User's Orders and Subscriptions
 @app.get("/users/{user_id}/orders", response_model=List[models.Order])
-def get_user_orders(user_id: int, db: Session = Depends(get_db)):
+def get_user_orders(user_id: int, fields: Optional[str] = FIELDS_QUERY, expand: Optional[str] = EXPAND_QUERY,
+                    db: Session = Depends(get_db)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user.orders
+    fieldset = parse_fieldset(Order, fields, expand)
+    if fieldset:
+        orders = db.query(Order).options(*fieldset.options()).filter(Order.user_id == user_id).all()
+        archived = archived_orders_for_user(db, user_id, fieldset.options(ArchivedOrder))
+        return sparse_response(fieldset, archived + orders)
+    return archived_orders_for_user(db, user_id) + user.orders
 
 @app.get("/users/{user_id}/subscriptions", response_model=List[models.Subscription])
-def get_user_subscriptions(user_id: int, db: Session = Depends(get_db)):
+def get_user_subscriptions(user_id: int, fields: Optional[str] = FIELDS_QUERY, expand: Optional[str] = EXPAND_QUERY,
+                           db: Session = Depends(get_db)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user.subscriptions
\ No newline at end of file
+    fieldset = parse_fieldset(Subscription, fields, expand)
+    if fieldset:
+        subscriptions = db.query(Subscription).options(*fieldset.options()).filter(Subscription.user_id == user_id).all()
+        return sparse_response(fieldset, subscriptions)
+    return user.subscriptions
+
+# Batched reads
+@app.post("/batch", response_model=models.BatchResponse, tags=["batch"])
+def batch_read(batch: models.BatchRequest, db: Session = Depends(get_db)):
+    """Resolve several resource reads in one round trip, batching lookups per resource type"""
+    if len(batch.requests) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} requests per batch")
+    return {"results": resolve_batch(db, batch.requests)}
+
+# Change feed for incremental sync
+@app.get("/changes", response_model=models.ChangeFeed, tags=["changes"])
+def get_changes(since: int = Query(0, ge=0), limit: int = Query(500, ge=1, le=MAX_CHANGES),
+                db: Session = Depends(get_db)):
+    """Inserts, updates, deletes and archivals recorded after sequence number since, oldest first"""
+    if not is_retained(db, since):
+        raise HTTPException(status_code=410, detail="Changes after since were pruned; resync and start again")
+    changes = read_changes(db, since, limit)
+    return {"changes": changes, "next_since": changes[-1].seq if changes else since}
+
+@app.get("/changes/stream", tags=["changes"])
+def stream_changes(request: Request, since: int = Query(0, ge=0)):
+    """Server-Sent Events stream of changes after since; each event id is its sequence number"""
+    # Reconnecting clients resume from the last event they saw
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since = max(since, int(last_event_id))
+    # A short-lived session: a dependency's would stay open for the whole stream
+    db = SessionLocal()
+    try:
+        retained = is_retained(db, since)
+    finally:
+        db.close()
+    if not retained:
+        raise HTTPException(status_code=410, detail="Changes after since were pruned; resync and start again")
+    return StreamingResponse(change_events(request, since), media_type="text/event-stream")
+
+# Maintenance
+@app.post("/admin/archive", tags=["admin"])
+def run_archive(older_than_days: int = Query(ARCHIVE_AFTER_DAYS, ge=0), db: Session = Depends(get_db)):
+    """Move finished orders older than the given age into the archive tables"""
+    return {"archived": archive_orders(db, older_than_days)}
+
+@app.post("/admin/exports", status_code=202, tags=["admin"])
+def start_export(background_tasks: BackgroundTasks, format: str = "parquet", full: bool = False):
+    """Start a columnar snapshot export in the background; only new rows unless full is set"""
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(FORMATS)}")
+    if importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=503, detail="Exports need pyarrow installed")
+    if not export_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="An export is already running")
+    background_tasks.add_task(run_export, format, full)
+    return {"status": "started"}
+
+@app.get("/admin/exports", tags=["admin"])
+def get_export_state():
+    """High-water marks and time of the last completed export"""
+    return load_state()
+
+# Bounded, read-only tools for AI agents
+app.include_router(mcp_tools.router)
+
+# Initialize MCP last so tool schemas are generated once, after every route is
+# registered. Only the bounded /tools routes are exposed; the full-table REST
+# routes stay out of reach of agents.
+mcp = FastApiMCP(
+    app,
+    name="Fred's Store MCP Server",
+    http_client=mcp_tools.mcp_http_client(app),
+    include_tags=["mcp"],
+    describe_all_responses=False,
+    describe_full_response_schema=False
+)
+
+# Mount the MCP server
+mcp.mount()
@@ -0,0 +1,218 @@
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import Session, load_only
+
+import models
+from archive import find_archived_order
+from database import get_db
+from db_models import User, Product, Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+from fieldsets import parse_fieldset
+from metrics import metrics
+
+# Hard cap on rows any tool returns, whatever the agent asks for
+MAX_ROWS = 50
+DEFAULT_ROWS = 20
+# Deepest page an agent can ask for; a merged listing reads offset + limit rows per table
+MAX_OFFSET = 1000
+# Aggregates are cheap to serve slightly stale and expensive to recompute
+AGGREGATE_TTL = 30
+# Client address fastapi_mcp's in-process requests carry; real HTTP clients can't
+MCP_CLIENT_HOST = "mcp"
+
+
+def mcp_http_client(app) -> httpx.AsyncClient:
+    """The client FastApiMCP uses to call routes, marking every request as an MCP tool call"""
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app, raise_app_exceptions=False, client=(MCP_CLIENT_HOST, 0)),
+        base_url="http://apiserver",
+        timeout=10.0,
+    )
+
+
+def instrument_tool_call(request: Request):
+    """Count MCP tool calls and their latency; direct REST calls to /tools aren't counted"""
+    if request.client is None or request.client.host != MCP_CLIENT_HOST:
+        yield
+        return
+
+    name = request.scope["route"].name
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.incr(f"mcp.{name}.errors")
+        raise
+    finally:
+        metrics.incr(f"mcp.{name}.calls")
+        metrics.incr(f"mcp.{name}.seconds", time.perf_counter() - started)
+
+
+class TTLCache:
+    """Tiny in-process cache for aggregate tool results"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get_or_compute(self, key: str, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            metrics.incr("mcp.cache.hits")
+            return entry[1]
+
+        metrics.incr("mcp.cache.misses")
+        value = compute()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+        return value
+
+
+aggregates = TTLCache(AGGREGATE_TTL)
+
+router = APIRouter(prefix="/tools", tags=["mcp"], dependencies=[Depends(instrument_tool_call)])
+
+LIMIT_QUERY = Query(DEFAULT_ROWS, ge=1, le=MAX_ROWS, description=f"Rows to return, at most {MAX_ROWS}")
+OFFSET_QUERY = Query(0, ge=0, le=MAX_OFFSET, description=f"Rows to skip, for paging, at most {MAX_OFFSET}")
+
+
+@router.get("/products", response_model=List[models.ProductRef], operation_id="list_products")
+def list_products(category: Optional[str] = None, limit: int = LIMIT_QUERY, offset: int = OFFSET_QUERY,
+                  db: Session = Depends(get_db)):
+    """List products (id, name, price) a page at a time, optionally within one category"""
+    query = db.query(Product).options(load_only(Product.id, Product.name, Product.price))
+    if category:
+        query = query.filter(Product.category == category)
+    return query.order_by(Product.id).offset(offset).limit(limit).all()
+
+
+@router.get("/products/top", response_model=List[models.ProductSales], operation_id="top_products")
+def top_products(limit: int = Query(10, ge=1, le=MAX_ROWS), db: Session = Depends(get_db)):
+    """Best-selling products by units sold, with the revenue they brought in"""
+    def compute():
+        # Archived orders still count towards sales
+        items = union_all(*[
+            select(model.product_id, model.quantity, model.price_at_purchase)
+            for model in (OrderItem, ArchivedOrderItem)
+        ]).subquery()
+        units = func.sum(items.c.quantity).label("units_sold")
+        revenue = func.sum(items.c.quantity * items.c.price_at_purchase).label("revenue")
+        rows = (
+            db.query(Product.id, Product.name, Product.price, units, revenue)
+            .join(items, items.c.product_id == Product.id)
+            .group_by(Product.id)
+            .order_by(units.desc())
+            .limit(limit)
+            .all()
+        )
+        return [
+            models.ProductSales(
+                product=models.ProductRef(id=row.id, name=row.name, price=row.price),
+                units_sold=row.units_sold,
+                revenue=round(row.revenue, 2),
+            )
+            for row in rows
+        ]
+
+    return aggregates.get_or_compute(f"top_products:{limit}", compute)
+
+
+@router.get("/products/{product_id}", response_model=models.Product, operation_id="get_product_details")
+def get_product_details(product_id: int, db: Session = Depends(get_db)):
+    """Full details of one product"""
+    product = db.query(Product).filter(Product.id == product_id).first()
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return product
+
+
+@router.get("/users", response_model=List[models.UserRef], operation_id="list_users")
+def list_users(limit: int = LIMIT_QUERY, offset: int = OFFSET_QUERY, db: Session = Depends(get_db)):
+    """List users (id, email, name) a page at a time"""
+    query = db.query(User).options(load_only(User.id, User.email, User.name))
+    return query.order_by(User.id).offset(offset).limit(limit).all()
+
+
+@router.get("/users/lookup", response_model=models.User, operation_id="find_user")
+def find_user(id: Optional[int] = None, email: Optional[str] = None, db: Session = Depends(get_db)):
+    """Find one user by id or by email address"""
+    if id is None and email is None:
+        raise HTTPException(status_code=400, detail="Provide an id or an email")
+    query = db.query(User)
+    query = query.filter(User.id == id) if id is not None else query.filter(User.email == email)
+    user = query.first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+
+@router.get("/orders", response_model=List[models.OrderSummary], operation_id="list_orders")
+def list_orders(user_id: Optional[int] = None, status: Optional[str] = None,
+                limit: int = LIMIT_QUERY, offset: int = OFFSET_QUERY, db: Session = Depends(get_db)):
+    """List order summaries, newest first, optionally for one user or status"""
+    fieldset = parse_fieldset(Order, "summary", None)
+    def query(model):
+        query = db.query(model).options(*fieldset.options(model))
+        if user_id is not None:
+            query = query.filter(model.user_id == user_id)
+        if status:
+            query = query.filter(model.status == status)
+        return query.order_by(model.created_at.desc())
+
+    # The store-wide listing stays on the hot table rather than paging
+    # through the archive, so the database does the paging
+    if user_id is None:
+        return [fieldset.render(order) for order in query(Order).offset(offset).limit(limit).all()]
+
+    # One user's history includes their archived orders; each table supplies
+    # at most offset + limit rows of the merged page
+    orders = []
+    for model in (Order, ArchivedOrder):
+        orders += query(model).limit(offset + limit).all()
+    orders.sort(key=lambda order: order.created_at or datetime.min, reverse=True)
+    return [fieldset.render(order) for order in orders[offset:offset + limit]]
+
+
+@router.get("/orders/{order_id}", response_model=models.Order, operation_id="get_order_details")
+def get_order_details(order_id: int, db: Session = Depends(get_db)):
+    """Full details of one order, including its items"""
+    order = db.query(Order).filter(Order.id == order_id).first()
+    if not order:
+        # Older orders may have moved to the archive
+        order = find_archived_order(db, order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+
+@router.get("/stats", response_model=models.StoreStats, operation_id="store_stats")
+def store_stats(db: Session = Depends(get_db)):
+    """Store-wide counts and completed revenue, archived orders included"""
+    def compute():
+        orders = union_all(*[
+            select(model.status, model.total_amount) for model in (Order, ArchivedOrder)
+        ]).subquery()
+        rows = db.query(orders.c.status, func.count()).group_by(orders.c.status).all()
+        by_status = {status or "Unknown": count for status, count in rows}
+        revenue = (
+            db.query(func.coalesce(func.sum(orders.c.total_amount), 0))
+            .filter(orders.c.status == "Completed")
+            .scalar()
+        )
+        return models.StoreStats(
+            users=db.query(func.count(User.id)).scalar(),
+            products=db.query(func.count(Product.id)).scalar(),
+            orders=sum(by_status.values()),
+            orders_by_status=by_status,
+            completed_revenue=round(revenue, 2),
+        )
+
+    return aggregates.get_or_compute("store_stats", compute)
@@ -0,0 +1,21 @@
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """Process-wide counters exposed through the /metrics route"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+
+metrics = Metrics()
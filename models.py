@@ -1,5 +1,5 @@
 from datetime import datetime, date
-from typing import Optional, List
+from typing import Any, Dict, Literal, Optional, List
 from pydantic import BaseModel
 
 class ProductBase(BaseModel):
@@ -24,6 +24,14 @@ class Product(ProductBase):
     class Config:
         from_attributes = True
 
+class ProductRef(BaseModel):
+    id: int
+    name: str
+    price: float
+
+    class Config:
+        from_attributes = True
+
 class UserBase(BaseModel):
     email: str
     name: str
@@ -42,6 +50,14 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+class UserRef(BaseModel):
+    id: int
+    email: str
+    name: str
+
+    class Config:
+        from_attributes = True
+
 class OrderItemBase(BaseModel):
     product_id: int
     quantity: int = 1
@@ -58,6 +74,13 @@ class OrderItem(OrderItemBase):
     class Config:
         from_attributes = True
 
+class OrderItemSummary(OrderItemBase):
+    id: int
+    product: Optional[ProductRef] = None
+
+    class Config:
+        from_attributes = True
+
 class OrderBase(BaseModel):
     user_id: int
     status: str = "Pending"
@@ -74,6 +97,13 @@ class Order(OrderBase):
     class Config:
         from_attributes = True
 
+class OrderSummary(OrderBase):
+    id: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
 class SubscriptionBase(BaseModel):
     user_id: int
     product_id: int
@@ -89,4 +119,54 @@ class Subscription(SubscriptionBase):
     product: Product
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True 
+
+class SubscriptionSummary(SubscriptionBase):
+    id: int
+
+    class Config:
+        from_attributes = True
+
+class BatchRequestItem(BaseModel):
+    resource: Literal["user", "product", "order", "subscription", "user_orders", "user_subscriptions"]
+    id: int
+
+class BatchRequest(BaseModel):
+    requests: List[BatchRequestItem]
+
+class BatchResult(BaseModel):
+    resource: str
+    id: int
+    status: int
+    data: Optional[Any] = None
+    detail: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchResult]
+
+class ProductSales(BaseModel):
+    product: ProductRef
+    units_sold: int
+    revenue: float
+
+class StoreStats(BaseModel):
+    users: int
+    products: int
+    orders: int
+    orders_by_status: Dict[str, int]
+    completed_revenue: float
+
+class ChangeEntry(BaseModel):
+    seq: int
+    table_name: str
+    row_id: int
+    op: str
+    data: Optional[Dict[str, Any]] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class ChangeFeed(BaseModel):
+    changes: List[ChangeEntry]
+    next_since: int
\ No newline at end of file
@@ -0,0 +1,45 @@
+"""Run Fred's Store with several worker processes.
+
+    python server.py --workers 4
+
+The database is initialized once here, before any worker starts, and the
+workers then skip their own initialization. Workers share the SQLite file
+and coordinate cache invalidation through it (see coordination.py).
+"""
+import argparse
+import os
+
+import uvicorn
+
+from coordination import PRELOADED_ENV, initializer_lock
+from init_db import init_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Fred's Store API")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "5002")))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        help="Worker processes to run (default: WEB_CONCURRENCY or the CPU count)",
+    )
+    parser.add_argument(
+        "--no-preload",
+        dest="preload",
+        action="store_false",
+        help="Let the workers initialize the database themselves on startup",
+    )
+    args = parser.parse_args()
+
+    if args.preload:
+        with initializer_lock():
+            init_db()
+        os.environ[PRELOADED_ENV] = "1"
+
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
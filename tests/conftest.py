@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Point the app at a throwaway database before anything imports database.py
+_tmp = tempfile.mkdtemp(prefix="freds_store_tests_")
+os.environ["FRED_STORE_DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'freds_store.db')}"
+os.environ["FRED_STORE_INIT_LOCK"] = os.path.join(_tmp, "freds_store.db.init.lock")
+os.environ["FRED_STORE_EXPORT_DIR"] = os.path.join(_tmp, "exports")
+os.environ["FRED_STORE_EXPORT_LOCK"] = os.path.join(_tmp, "freds_store.db.export.lock")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from main import app  # noqa: E402
+from database import SessionLocal  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def db(client):
+    # Depends on client so the app has created and seeded the database
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
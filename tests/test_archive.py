@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+
+from archive import archive_orders
+from db_models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+
+
+def _finished_order(db, user_id: int, days_old: int) -> Order:
+    order = Order(user_id=user_id, status="Completed", total_amount=10.0,
+                  created_at=datetime.utcnow() - timedelta(days=days_old))
+    db.add(order)
+    db.flush()
+    db.add(OrderItem(order_id=order.id, product_id=1, quantity=1, price_at_purchase=10.0))
+    db.commit()
+    return order
+
+
+def _new_order(client, items=True) -> dict:
+    payload = {"user_id": 1, "total_amount": 5.0,
+               "items": [{"product_id": 1, "quantity": 1, "price_at_purchase": 5.0}] if items else []}
+    response = client.post("/orders", json=payload)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_archived_ids_are_never_reused(client, db):
+    old_id = _finished_order(db, 1, 400).id
+    archive_orders(db, older_than_days=365)
+    assert db.get(Order, old_id) is None
+    assert db.get(ArchivedOrder, old_id) is not None
+
+    # Deleting the newest hot order used to let SQLite hand its id, or an
+    # archived one, out again
+    newest_id = db.query(Order.id).order_by(Order.id.desc()).first()[0]
+    assert client.delete(f"/orders/{newest_id}").status_code == 200
+
+    highest_archived_order = db.query(ArchivedOrder.id).order_by(ArchivedOrder.id.desc()).first()[0]
+    highest_archived_item = db.query(ArchivedOrderItem.id).order_by(ArchivedOrderItem.id.desc()).first()[0]
+    empty = _new_order(client, items=False)
+    full = _new_order(client)
+    assert empty["id"] > max(newest_id, highest_archived_order)
+    assert full["id"] > empty["id"]
+    assert full["items"][0]["id"] > highest_archived_item
+
+    # The new orders archive cleanly alongside the old ones
+    for order_id in (empty["id"], full["id"]):
+        db.query(Order).filter(Order.id == order_id).update({
+            "status": "Completed", "created_at": datetime.utcnow() - timedelta(days=400)
+        })
+    db.commit()
+    assert archive_orders(db, older_than_days=365) == 2
+    assert archive_orders(db, older_than_days=365) == 0
+
+
+def test_reads_fall_through_to_archive(client, db):
+    order_id = _finished_order(db, 2, 400).id
+    archive_orders(db, older_than_days=365)
+
+    response = client.get(f"/orders/{order_id}")
+    assert response.status_code == 200
+    assert response.json()["id"] == order_id
+    assert len(response.json()["items"]) == 1
+
+    sparse = client.get(f"/orders/{order_id}", params={"fields": "id,status"})
+    assert sparse.json() == {"id": order_id, "status": "Completed"}
+
+    user_orders = client.get("/users/2/orders").json()
+    assert order_id in [order["id"] for order in user_orders]
+
+    assert client.get("/orders/999999").status_code == 404
+
+
+def test_tools_include_archived_orders(client, db):
+    import mcp_tools
+    mcp_tools.aggregates._entries.clear()
+    before = client.get("/tools/stats").json()
+    order_id = _finished_order(db, 3, 400).id
+    archive_orders(db, older_than_days=365)
+
+    mcp_tools.aggregates._entries.clear()
+    after = client.get("/tools/stats").json()
+    assert after["orders"] == before["orders"] + 1
+    assert after["completed_revenue"] == round(before["completed_revenue"] + 10.0, 2)
+
+    assert client.get(f"/tools/orders/{order_id}").json()["id"] == order_id
+    user_orders = client.get("/tools/orders", params={"user_id": 3, "limit": 50}).json()
+    assert order_id in [order["id"] for order in user_orders]
+    assert user_orders[-1]["id"] == order_id  # the oldest, so listed last
+    assert order_id not in [order["id"] for order in client.get("/tools/orders", params={"limit": 50}).json()]
+
+    top = client.get("/tools/products/top", params={"limit": 50}).json()
+    archived_units = sum(item.quantity for item in db.query(ArchivedOrderItem).filter(ArchivedOrderItem.product_id == 1))
+    hot_units = sum(item.quantity for item in db.query(OrderItem).filter(OrderItem.product_id == 1))
+    product = next(sales for sales in top if sales["product"]["id"] == 1)
+    assert product["units_sold"] == archived_units + hot_units
+
+
+def test_expanded_user_orders_include_archive(client, db):
+    order_id = _finished_order(db, 4, 400).id
+    archive_orders(db, older_than_days=365)
+    expected = {order["id"] for order in client.get("/users/4/orders").json()}
+    assert order_id in expected
+
+    user = client.get("/users/4", params={"expand": "orders.items"}).json()
+    assert {order["id"] for order in user["orders"]} == expected
+    archived = next(order for order in user["orders"] if order["id"] == order_id)
+    assert len(archived["items"]) == 1
+
+    listed = next(user for user in client.get("/users", params={"expand": "orders"}).json() if user["id"] == 4)
+    assert {order["id"] for order in listed["orders"]} == expected
+
+    via_order = client.get(f"/orders/{order_id}", params={"expand": "user.orders"}).json()
+    assert {order["id"] for order in via_order["user"]["orders"]} == expected
+
+
+def test_archived_orders_can_be_deleted(client, db):
+    order_id = _finished_order(db, 5, 400).id
+    archive_orders(db, older_than_days=365)
+    item_ids = [item.id for item in db.get(ArchivedOrder, order_id).items]
+
+    assert client.delete(f"/orders/{order_id}").status_code == 200
+    assert client.get(f"/orders/{order_id}").status_code == 404
+    assert client.delete(f"/orders/{order_id}").status_code == 404
+    db.expire_all()
+    assert db.get(ArchivedOrder, order_id) is None
+    assert all(db.get(ArchivedOrderItem, item_id) is None for item_id in item_ids)
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from archive import archive_orders
+from database import engine
+from db_models import Order, OrderItem, Product, Subscription
+
+
+def _batch(client, requests):
+    statements = []
+    def record(connection, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.post("/batch", json={"requests": requests})
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert response.status_code == 200
+    return response.json()["results"], statements
+
+
+def _archived_order(db, user_id: int) -> int:
+    order = Order(user_id=user_id, status="Completed", total_amount=3.0,
+                  created_at=datetime.utcnow() - timedelta(days=400))
+    db.add(order)
+    db.flush()
+    db.add(OrderItem(order_id=order.id, product_id=2, quantity=1, price_at_purchase=3.0))
+    db.commit()
+    order_id = order.id
+    archive_orders(db, older_than_days=365)
+    return order_id
+
+
+def test_products_are_fetched_in_one_query(client, db):
+    order_ids = [order.id for order in db.query(Order.id).limit(4)]
+    subscription_ids = [subscription.id for subscription in db.query(Subscription.id).limit(3)]
+    product_ids = [product.id for product in db.query(Product.id).limit(4)]
+    requests = (
+        [{"resource": "order", "id": order_id} for order_id in order_ids]
+        + [{"resource": "subscription", "id": subscription_id} for subscription_id in subscription_ids]
+        + [{"resource": "product", "id": product_id} for product_id in product_ids]
+        + [{"resource": "user_orders", "id": 1}, {"resource": "user", "id": 2}]
+    )
+
+    results, statements = _batch(client, requests)
+    assert [result["status"] for result in results] == [200] * len(requests)
+    assert len([statement for statement in statements if "FROM products" in statement]) == 1
+
+    # Twice the reads, the same number of queries
+    _, doubled = _batch(client, requests + requests)
+    assert len(doubled) == len(statements)
+
+
+def test_missing_rows_are_404s(client):
+    results, _ = _batch(client, [
+        {"resource": "product", "id": 999999},
+        {"resource": "order", "id": 999999},
+        {"resource": "user_orders", "id": 999999},
+        {"resource": "product", "id": 1},
+    ])
+    assert [result["status"] for result in results] == [404, 404, 404, 200]
+    assert results[0]["detail"] == "Product not found"
+    assert results[2]["detail"] == "User not found"
+
+
+def test_archived_orders_are_found(client, db):
+    order_id = _archived_order(db, 6)
+    results, statements = _batch(client, [
+        {"resource": "order", "id": order_id},
+        {"resource": "user_orders", "id": 6},
+    ])
+    assert [result["status"] for result in results] == [200, 200]
+    assert results[0]["data"]["id"] == order_id
+    assert results[0]["data"]["items"][0]["product_id"] == 2
+    assert order_id in [order["id"] for order in results[1]["data"]]
+    assert len([statement for statement in statements if "FROM products" in statement]) == 1
+
+
+def test_oversized_batch_is_rejected(client):
+    from batch import MAX_BATCH_SIZE
+    response = client.post("/batch", json={"requests": [{"resource": "product", "id": 1}] * (MAX_BATCH_SIZE + 1)})
+    assert response.status_code == 400
@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+from datetime import date, datetime, timedelta
+
+import db_models
+from db_models import ChangeLogEntry, Product
+
+
+def test_changes_recorded_without_importing_changes_module(client):
+    # client creates the database the script writes to
+    # A maintenance script that only knows the models still feeds the change log
+    script = (
+        "from datetime import date\n"
+        "from database import SessionLocal\n"
+        "from db_models import ChangeLogEntry, Product\n"
+        "import sys\n"
+        "db = SessionLocal()\n"
+        "product = Product(name='Script product', price=1.0, stock=1, category='Test', release_date=date.today())\n"
+        "db.add(product)\n"
+        "db.commit()\n"
+        "entry = db.query(ChangeLogEntry).order_by(ChangeLogEntry.seq.desc()).first()\n"
+        "assert 'changes' not in sys.modules\n"
+        "assert (entry.table_name, entry.row_id, entry.op) == ('products', product.id, 'insert')\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", script], cwd=root, check=True)
+
+
+def test_old_changes_are_pruned(client, db, monkeypatch):
+    product = Product(name="Pruned product", price=1.0, stock=1, category="Test", release_date=date.today())
+    db.add(product)
+    db.commit()
+    since = client.get("/changes", params={"since": 0, "limit": 1000}).json()["next_since"]
+
+    db.query(ChangeLogEntry).update({"created_at": datetime.utcnow() - timedelta(days=30)})
+    db.commit()
+    monkeypatch.setattr(db_models, "_next_prune", 0.0)
+    product.price = 2.0
+    db.commit()
+
+    entries = db.query(ChangeLogEntry).all()
+    assert [(entry.row_id, entry.op) for entry in entries] == [(product.id, "update")]
+    assert entries[0].seq > since
+
+    # Clients behind the pruned entries must resync; the newest cursor still works
+    assert client.get("/changes", params={"since": 0}).status_code == 410
+    assert client.get("/changes/stream", params={"since": 0}).status_code == 410
+    feed = client.get("/changes", params={"since": since}).json()
+    assert [change["seq"] for change in feed["changes"]] == [entries[0].seq]
+
+
+def test_archived_orders_appear_in_the_feed(client, db):
+    from archive import archive_orders
+    from db_models import Order, OrderItem
+
+    order = Order(user_id=1, status="Completed", total_amount=1.0,
+                  created_at=datetime.utcnow() - timedelta(days=400))
+    db.add(order)
+    db.flush()
+    item = OrderItem(order_id=order.id, product_id=1, quantity=1, price_at_purchase=1.0)
+    db.add(item)
+    db.commit()
+    order_id, item_id = order.id, item.id
+    since = db.query(ChangeLogEntry.seq).order_by(ChangeLogEntry.seq.desc()).first()[0]
+
+    archive_orders(db, older_than_days=365)
+
+    changes = client.get("/changes", params={"since": since}).json()["changes"]
+    assert [(change["table_name"], change["row_id"], change["op"]) for change in changes] == [
+        ("orders", order_id, "archive"), ("order_items", item_id, "archive"),
+    ]
@@ -0,0 +1,97 @@
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from compression import MINIMUM_SIZE, CompressionMiddleware, brotli, negotiate_encoding
+from coordination import invalidations
+from db_models import CacheInvalidation, Product
+from metrics import metrics
+
+
+def test_negotiate_encoding():
+    preferred = "br" if brotli is not None else "gzip"
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding("") is None
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("gzip") == "gzip"
+    assert negotiate_encoding("GZIP ; q=0.5") == "gzip"
+    assert negotiate_encoding("*") == preferred
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding("gzip;q=bogus") is None
+    assert negotiate_encoding("*, gzip;q=0") == ("br" if brotli is not None else None)
+    if brotli is not None:
+        assert negotiate_encoding("br;q=0.2, gzip;q=0.8") == "gzip"
+        assert negotiate_encoding("gzip, br") == "br"
+
+
+def _app(content_type: str, size: int) -> TestClient:
+    async def endpoint(request):
+        return Response(b"x" * size, media_type=content_type)
+    app = Starlette(routes=[Route("/", endpoint)])
+    app.add_middleware(CompressionMiddleware)
+    return TestClient(app)
+
+
+def test_only_bodies_above_the_threshold_are_compressed():
+    small = _app("application/json", MINIMUM_SIZE - 1).get("/", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert len(small.content) == MINIMUM_SIZE - 1
+
+    large = _app("application/json", MINIMUM_SIZE).get("/", headers={"Accept-Encoding": "gzip"})
+    assert large.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in large.headers["vary"]
+    assert int(large.headers["content-length"]) < MINIMUM_SIZE
+    assert large.content == b"x" * MINIMUM_SIZE
+
+    plain = _app("application/json", MINIMUM_SIZE).get("/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+
+
+def test_event_streams_and_binary_types_pass_through():
+    for content_type in ("text/event-stream", "image/png"):
+        response = _app(content_type, 10 * MINIMUM_SIZE).get("/", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+        assert len(response.content) == 10 * MINIMUM_SIZE
+
+
+def test_catalog_is_precompressed(client):
+    response = client.get("/products", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    raw = client.get("/products", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in raw.headers
+    assert response.json() == raw.json()
+
+    # Later requests reuse the stored variant instead of compressing again
+    hits = metrics.snapshot().get("precompressed.hits", 0)
+    compressed = metrics.snapshot().get("compression.gzip.responses", 0)
+    client.get("/products", headers={"Accept-Encoding": "gzip"})
+    assert metrics.snapshot().get("precompressed.hits", 0) == hits + 1
+    assert metrics.snapshot().get("compression.gzip.responses", 0) == compressed
+
+
+def test_catalog_cache_invalidated_by_product_writes(client):
+    client.get("/products")
+    created = client.post("/products", json={"name": "Cache test", "price": 9.99}).json()
+    assert created["id"] in [product["id"] for product in client.get("/products").json()]
+
+    client.put(f"/products/{created['id']}", json={"name": "Cache test renamed", "price": 9.99})
+    names = {product["id"]: product["name"] for product in client.get("/products").json()}
+    assert names[created["id"]] == "Cache test renamed"
+
+    client.delete(f"/products/{created['id']}")
+    assert created["id"] not in [product["id"] for product in client.get("/products").json()]
+
+
+def test_catalog_cache_invalidated_by_other_workers(client, db, monkeypatch):
+    client.get("/products")
+    # Another worker changes a product and publishes the invalidation
+    product = db.query(Product).first()
+    product.name = "Renamed elsewhere"
+    db.add(CacheInvalidation(key="products"))
+    db.commit()
+    monkeypatch.setattr(invalidations, "_next_poll", 0.0)
+
+    names = {item["id"]: item["name"] for item in client.get("/products").json()}
+    assert names[product.id] == "Renamed elsewhere"
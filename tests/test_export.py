@@ -0,0 +1,67 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import pyarrow.parquet as pq  # noqa: E402
+
+from archive import archive_orders  # noqa: E402
+from coordination import FileLock  # noqa: E402
+from db_models import Order, OrderItem  # noqa: E402
+from export import export_lock, export_snapshot  # noqa: E402
+
+
+def _exported_ids(result, table):
+    ids = []
+    for exported in result["files"]:
+        if os.path.basename(os.path.dirname(exported["path"])) == table:
+            ids += pq.read_table(exported["path"], columns=["id"]).column("id").to_pylist()
+    return ids
+
+
+def test_archived_orders_are_exported_once(db, tmp_path):
+    first = export_snapshot(str(tmp_path))
+    assert not set(_exported_ids(first, "orders")) & set(_exported_ids(first, "archived_orders"))
+
+    # One order exported while hot, one created after the export; both are then archived
+    old = datetime.utcnow() - timedelta(days=400)
+    exported = db.query(Order).order_by(Order.id.desc()).first()
+    exported.status, exported.created_at = "Completed", old
+    fresh = Order(user_id=1, status="Completed", total_amount=1.0, created_at=old)
+    db.add(fresh)
+    db.flush()
+    db.add(OrderItem(order_id=fresh.id, product_id=1, quantity=1, price_at_purchase=1.0))
+    db.commit()
+    fresh_id = fresh.id
+    archive_orders(db, older_than_days=365)
+
+    second = export_snapshot(str(tmp_path))
+    assert _exported_ids(second, "archived_orders") == [fresh_id]
+    assert _exported_ids(second, "orders") == []
+
+
+def test_export_lock_is_held_across_processes(client):
+    # A second FileLock on the same path stands in for another worker process
+    other_process = FileLock(export_lock.path)
+    assert other_process.acquire(blocking=False)
+    try:
+        assert client.post("/admin/exports").status_code == 409
+    finally:
+        other_process.release()
+
+
+
+def test_full_export_replaces_earlier_files(db, tmp_path):
+    export_snapshot(str(tmp_path))
+    db.add(Order(user_id=1, status="Pending", total_amount=1.0))
+    db.commit()
+    export_snapshot(str(tmp_path))
+    assert len(os.listdir(tmp_path / "orders")) == 2
+
+    full = export_snapshot(str(tmp_path), full=True)
+    for table in ("users", "orders", "order_items"):
+        assert len(os.listdir(tmp_path / table)) == 1
+    order_ids = _exported_ids(full, "orders")
+    assert sorted(order_ids) == sorted(order.id for order in db.query(Order.id))
@@ -0,0 +1,58 @@
+import pytest
+from fastapi import HTTPException
+
+from db_models import Order
+from fieldsets import parse_fieldset
+
+FULL_ORDER_KEYS = {"id", "user_id", "status", "total_amount", "created_at", "items"}
+
+
+@pytest.mark.parametrize("fields,expand", [(None, None), ("", None), (None, ""), (" , ", ","), ("", "  ")])
+def test_blank_values_mean_not_given(fields, expand):
+    assert parse_fieldset(Order, fields, expand) is None
+
+
+@pytest.mark.parametrize("params", [{}, {"fields": ""}, {"expand": ""}, {"fields": "", "expand": ""}])
+def test_blank_values_keep_the_full_response(client, params):
+    order = client.get("/orders/1", params=params).json()
+    assert set(order) == FULL_ORDER_KEYS
+    assert "product" in order["items"][0]
+
+
+def test_selected_fields(client):
+    assert client.get("/orders/1", params={"fields": "status"}).json().keys() == {"id", "status"}
+    assert client.get("/orders/1", params={"fields": " status , total_amount,status"}).json().keys() == {
+        "id", "status", "total_amount",
+    }
+
+
+def test_summary_fields(client):
+    order = client.get("/orders/1", params={"fields": "summary"}).json()
+    assert set(order) == {"id", "user_id", "status", "total_amount", "created_at"}
+
+
+def test_nested_expansion(client):
+    order = client.get("/orders/1", params={"fields": "status", "expand": "items.product"}).json()
+    assert set(order) == {"id", "status", "items"}
+    item = order["items"][0]
+    assert set(item) == {"id", "product_id", "quantity", "price_at_purchase", "product"}
+    assert set(item["product"]) == {"id", "name", "price"}
+
+
+def test_expansion_without_fields_keeps_every_column(client):
+    order = client.get("/orders/1", params={"expand": "user"}).json()
+    assert set(order) == FULL_ORDER_KEYS - {"items"} | {"user"}
+    assert set(order["user"]) == {"id", "email", "name"}
+
+
+def test_unknown_field_or_expansion_is_400(client):
+    response = client.get("/orders", params={"fields": "status,bogus"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown field 'bogus' for orders"
+
+    response = client.get("/orders", params={"expand": "items.user"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cannot expand 'items.user' on orders"
+
+    with pytest.raises(HTTPException):
+        parse_fieldset(Order, "summary", "product")
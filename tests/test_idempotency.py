@@ -0,0 +1,123 @@
+import asyncio
+import json
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+import idempotency
+from database import engine
+from db_models import IdempotencyKey, Order
+from idempotency import IdempotencyMiddleware, IdempotencyStore, _fingerprint
+
+
+def _order_body(total: float) -> bytes:
+    return json.dumps({
+        "user_id": 1, "total_amount": total,
+        "items": [{"product_id": 1, "quantity": 1, "price_at_purchase": total}],
+    }).encode()
+
+
+def _post(client, key: str, body: bytes):
+    return client.post("/orders", content=body,
+                       headers={"Idempotency-Key": key, "Content-Type": "application/json"})
+
+
+def _orders(db) -> int:
+    return db.query(Order).count()
+
+
+def _fingerprint_for(body: bytes) -> str:
+    return _fingerprint({"method": "POST", "path": "/orders", "query_string": b""}, body)
+
+
+def test_retry_replays_the_first_response(client, db):
+    before = _orders(db)
+    first = _post(client, "replay", _order_body(11.0))
+    retry = _post(client, "replay", _order_body(11.0))
+    assert first.status_code == retry.status_code == 200
+    assert retry.json()["id"] == first.json()["id"]
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert _orders(db) == before + 1
+
+    mismatch = _post(client, "replay", _order_body(12.0))
+    assert mismatch.status_code == 422
+    assert _orders(db) == before + 1
+
+
+def test_concurrent_duplicates_create_one_order(client, db):
+    before = _orders(db)
+    responses = []
+    threads = [
+        threading.Thread(target=lambda: responses.append(_post(client, "concurrent", _order_body(13.0))))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [response.status_code for response in responses] == [200] * 8
+    assert len({response.json()["id"] for response in responses}) == 1
+    assert _orders(db) == before + 1
+
+
+def test_stale_claim_is_taken_over(client, db):
+    # A worker crashed after claiming the key, leaving it unfinished
+    body = _order_body(14.0)
+    now = datetime.utcnow()
+    db.add(IdempotencyKey(key="crashed", fingerprint=_fingerprint_for(body),
+                          claimed_at=now - timedelta(hours=1), expires_at=now + timedelta(hours=1)))
+    db.commit()
+
+    before = _orders(db)
+    response = _post(client, "crashed", body)
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response.headers
+    assert _orders(db) == before + 1
+    assert _post(client, "crashed", body).headers["Idempotent-Replayed"] == "true"
+
+
+def test_running_claim_is_waited_on_read_only(client, db, monkeypatch):
+    body = _order_body(15.0)
+    now = datetime.utcnow()
+    db.add(IdempotencyKey(key="running", fingerprint=_fingerprint_for(body),
+                          claimed_at=now, expires_at=now + timedelta(hours=1)))
+    db.commit()
+    monkeypatch.setattr(idempotency, "WAIT_TIMEOUT", 0.3)
+
+    statements = []
+    def record(connection, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = _post(client, "running", body)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert response.status_code == 409
+    assert len(statements) > 1
+    assert all(statement.lstrip().upper().startswith("SELECT") for statement in statements)
+
+
+def test_cancelled_request_releases_its_key(client, db):
+    async def cancelled_app(scope, receive, send):
+        raise asyncio.CancelledError()
+
+    async def receive():
+        return {"type": "http.request", "body": b"{}", "more_body": False}
+
+    async def send(message):
+        pass
+
+    middleware = IdempotencyMiddleware(cancelled_app, IdempotencyStore())
+    scope = {"type": "http", "method": "POST", "path": "/orders", "query_string": b"",
+             "headers": [(b"idempotency-key", b"cancelled")]}
+    try:
+        asyncio.run(middleware(scope, receive, send))
+    except asyncio.CancelledError:
+        pass
+    else:
+        raise AssertionError("CancelledError was swallowed")
+
+    assert db.get(IdempotencyKey, "cancelled") is None
@@ -0,0 +1,34 @@
+from sqlalchemy import event
+
+from database import engine
+from mcp_tools import MAX_OFFSET
+
+
+def test_order_listing_pages_in_the_database(client, db):
+    statements = []
+    def record(connection, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.get("/tools/orders", params={"offset": MAX_OFFSET, "limit": 50})
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    assert response.json() == []
+    assert any("OFFSET" in statement for statement in statements if "FROM orders" in statement)
+    assert not any("archived_orders" in statement for statement in statements)
+
+
+def test_offset_is_capped(client):
+    assert client.get("/tools/orders", params={"offset": MAX_OFFSET + 1}).status_code == 422
+    assert client.get("/tools/orders", params={"user_id": 1, "offset": 1_000_000}).status_code == 422
+
+
+def test_user_order_listing_pages_across_archive(client):
+    everything = client.get("/tools/orders", params={"user_id": 1, "limit": 50}).json()
+    pages = [
+        client.get("/tools/orders", params={"user_id": 1, "offset": offset, "limit": 1}).json()
+        for offset in range(len(everything) + 1)
+    ]
+    assert [order for page in pages for order in page] == everything